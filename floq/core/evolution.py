@@ -363,16 +363,22 @@ def calculate_du(dk, psi, vals, vecs, p):
 def calculate_factors(dk, nz, nz_max, dim, npm, vals, vecs, vecsstar, omega, t):
     # Factors in the sum for dU that only depend on dn=n1-n2, and therefore
     # can be computed more efficiently outside the "full" loop
+    #
+    # The expectation values <v1|dk|v2> are computed for all control parameters
+    # and pairs of eigenvectors at once, as contractions of the whole stack dk.
     factors = np.empty([npm, 2*nz+1, dim, dim], dtype=np.complex128)
 
+    # The eigenvectors, with the Fourier components joined again,
+    # as rows of an array, and dk|v2> for all of them, which
+    # does not depend on dn: dkvecs[c, :, i2] = dk[c]|vecs[i2]>
+    k_dim = vecs.shape[1]*vecs.shape[2]
+    dkvecs = np.dot(dk, vecs.reshape(dim, k_dim).T)
+
     for dn in xrange(-nz_max*2, 2*nz_max+1):
         idn = n_to_i(dn, 2*nz)
-        for i1 in xrange(0, dim):
-            for i2 in xrange(0, dim):
-                v1 = np.roll(vecsstar[i1], dn, axis=0)  # not supported by numba!
-                for c in xrange(0, npm):
-                    factors[c, idn, i1, i2] = (integral_factors(vals[i1], vals[i2], dn, omega, t) *
-                                               expectation_value(dk[c], v1, vecs[i2]))
+        v1 = np.roll(vecsstar, dn, axis=1).reshape(dim, k_dim)  # not supported by numba!
+        expectation_values = np.einsum('ak,ckb->cab', v1, dkvecs)
+        factors[:, idn, :, :] = integral_factors_matrix(vals, dn, omega, t)*expectation_values
 
     return factors
 
@@ -394,21 +400,20 @@ def assemble_du(nz, nz_max, dim, npm, alphas, psi, vecsstar):
     return du
 
 
+@autojit(nopython=True)
+def integral_factors_matrix(vals, dn, omega, t):
+    # integral_factors for all pairs of eigenvalues
+    dim = vals.shape[0]
+    result = numba_zeros((dim, dim))
+    for i1 in range(0, dim):
+        for i2 in range(0, dim):
+            result[i1, i2] = integral_factors(vals[i1], vals[i2], dn, omega, t)
+    return result
+
+
 @autojit(nopython=True)
 def integral_factors(e1, e2, dn, omega, t):
     if e1 == e2 and dn == 0:
         return -1.0j*cmath.exp(-1j*t*e1)*t
     else:
         return (cmath.exp(-1j*t*e1)-cmath.exp(-1j*t*(e2-omega*dn)))/((e1-e2+omega*dn))
-
-
-@autojit(nopython=True)
-def expectation_value(dk, v1, v2):
-    # Computes <v1|dk|v2>, assuming v1 is already conjugated
-
-    # v1 and v2 are split into Fourier components,
-    # we undo that here
-    a = v1.flatten()
-    b = v2.flatten()
-
-    return np.dot(np.dot(a, dk), b)
@@ -1,5 +1,4 @@
 import numpy as np
-from floq.helpers.matrix import adjoint
 
 
 def transfer_fidelity(u, initial, final):
@@ -19,11 +18,10 @@ def d_transfer_fidelity(u, dus, initial, final):
     fid' = (<f|u|i><i|u|f>)' = <f|u'|i><i|u|f> + <f|u|i><i|u'|f>
     = 2 Re(<f|u'|i><i|u|f>)
     """
-    iuf = expectation_value(initial, adjoint(u), final)
-    fui = expectation_value(final, u, initial)
+    iuf = np.conj(expectation_value(final, u, initial))
+    fdui = np.dot(np.dot(dus, initial), np.conj(final))
 
-    return np.real(np.array([expectation_value(final, du, initial)*iuf +
-                             expectation_value(initial, adjoint(du), final)*fui for du in dus]))
+    return 2.0*np.real(fdui*iuf)
 
 
 def transfer_distance(u, initial, final):
@@ -57,8 +55,13 @@ def operator_fidelity(u, target):
 def d_operator_fidelity(u, dus, target):
     """
     Calculate the gradient of the operator fidelity.
+
+    This is Re(trace(target^\dagger du))/dim for each du.
     """
-    return np.array([operator_fidelity(du, target) for du in dus])
+    dim = u.shape[0]
+    dus = np.asarray(dus)
+    hs = np.dot(dus.reshape(dus.shape[0], -1), np.conj(target).ravel())
+    return hs.real/dim
 
 
 
@@ -96,6 +99,8 @@ def hilbert_schmidt_product(a, b):
     """
     Compute the Hilbert-Schmidt inner product between
     operators a and b.
+
+    trace(a^\dagger b) is the sum of conj(a)*b over all entries,
+    so no matrix product is needed.
     """
-    a = np.matrix(a)
-    return np.trace(np.dot(a.getH(), b))
+    return np.vdot(a, b)
@@ -1,4 +1,5 @@
 import numpy as np
+from numba import autojit
 
 
 def is_unitary(u, tolerance=1e-10):
@@ -7,12 +8,19 @@ def is_unitary(u, tolerance=1e-10):
     digits = int(np.log10(1/tolerance))
     dim = u.shape[0]
 
-    unitary = np.eye(dim, dtype=np.complex128)
-    umat = np.mat(u)
-    product = umat.H * umat
-    product = np.round(product, digits-1)  # required for some edge cases
+    # Same criterion as np.allclose(u^dagger u, 1, atol=tolerance),
+    # whose default relative tolerance applies to the diagonal
+    rtol = 1e-5
 
-    return np.allclose(product, unitary, atol=tolerance)
+    # u^dagger u - 1, with all further steps done in place
+    deviation = np.dot(np.conj(u).T, u)
+    deviation.flat[::dim+1] -= 1.0
+    np.round(deviation, digits-1, out=deviation)  # required for some edge cases
+
+    deviation = np.abs(deviation, out=deviation).real
+    deviation.flat[::dim+1] -= rtol*1.0
+
+    return deviation.max() <= tolerance
 
 
 def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
@@ -39,46 +47,120 @@ def gram_schmidt(vecs):
     The orthonormalisation is done with respect to the inner product
     used in QM: <a | b> = a^dagger b, i.e. including a complex conjugation.
 
-    The algorithm implemented is the modified Gram-Schmidt procedure,
-    given in Numerical Methods for Large Eigenvalue Problems: Revised Edition, algorithm 1.2.
+    The algorithm implemented is an iterated Gram-Schmidt procedure:
+    each vector is projected against all previous ones, and the projection
+    is repeated (at most three times) while the norm drops below 0.1 of its previous
+    value. This keeps the result orthonormal for nearly dependent vectors.
+
+    For fewer than 64 vectors (the common case of small degenerate subspaces),
+    a compiled version with explicit loops is used, which projects with modified
+    Gram-Schmidt sweeps. Otherwise classical Gram-Schmidt projections are done
+    blockwise by numpy. Both yield the same basis in exact arithmetic,
+    and agree up to rounding unless the vectors are nearly dependent.
     """
 
-    result = np.zeros_like(vecs)
-    n = vecs.shape[0]
+    # Every row gets written, so there is no need to zero the memory.
+    # The dtype is at least float64, normalising integer vectors must not truncate.
+    result = np.empty_like(vecs, dtype=np.result_type(vecs, np.float64))
 
-    r = norm(vecs[0])
-    if r == 0.0:
-        raise ArithmeticError("Vector with norm 0 occured.")
+    if vecs.shape[0] < 64:
+        success = numba_gram_schmidt(vecs, result)
     else:
-        result[0] = vecs[0]/r
+        success = block_gram_schmidt(vecs, result)
 
-    for j in xrange(1, n):
-        q = vecs[j]
+    if not success:
+        raise ArithmeticError("Vector with norm 0 occured.")
+
+    return result
 
-        for i in xrange(j):
-            rij = product(result[i], q)
 
-            q = q-rij*result[i]
+def block_gram_schmidt(vecs, result):
+    # Iterated classical Gram-Schmidt, projecting each vector
+    # against the whole block of previous ones at once.
+    # Writes into result, returns False if a vector with norm 0 occurs.
+    n = vecs.shape[0]
+
+    for j in range(0, n):
+        q = vecs[j]
+        basis = result[:j]
 
         rjj = norm(q)
+        if j > 0:
+            for iteration in range(3):
+                r_prev = rjj
+
+                rij = np.conj(basis).dot(q)
+                q = q-rij.dot(basis)
+
+                rjj = norm(q)
+                if rjj >= 0.1*r_prev:
+                    break
 
         if rjj == 0.0:
-            raise ArithmeticError("Vector with norm 0 occured.")
+            return False
         else:
             result[j] = q/rjj
 
-    return result
+    return True
+
+
+@autojit(nopython=True)
+def numba_gram_schmidt(vecs, result):
+    # Counterpart of block_gram_schmidt with explicit loops, using modified
+    # instead of classical Gram-Schmidt sweeps: the vector being orthogonalised
+    # is kept in result[j] and updated after each single projection.
+    n = vecs.shape[0]
+    m = vecs.shape[1]
+
+    for j in range(n):
+        for k in range(m):
+            result[j, k] = vecs[j, k]
+
+        rjj = numba_row_norm(result, j)
+        if j > 0:
+            for iteration in range(3):
+                r_prev = rjj
+
+                for i in range(j):
+                    rij = np.conj(result[i, 0])*result[j, 0]
+                    for k in range(1, m):
+                        rij += np.conj(result[i, k])*result[j, k]
+                    for k in range(m):
+                        result[j, k] -= rij*result[i, k]
+
+                rjj = numba_row_norm(result, j)
+                if rjj >= 0.1*r_prev:
+                    break
+
+        if rjj == 0.0:
+            return False
+
+        for k in range(m):
+            result[j, k] /= rjj
+
+    return True
+
+@autojit(nopython=True)
+def numba_row_norm(a, j):
+    s = 0.0
+    for k in range(a.shape[1]):
+        s += abs(a[j, k])**2
+    return np.sqrt(s)
 
 
 def product(a, b):
     """Compute <a | b>.
 
-    Includes complex conjugation!"""
+    Includes complex conjugation!
+    (np.vdot conjugates on the fly, without computing conj(a) first.)"""
+
+    if a is b:
+        return np.vdot(a, a).real  # <a | a> is real
 
-    return np.conj(a).dot(b)
+    return np.vdot(a, b)
 
 
 def norm(a):
-    """Compute sqrt(<a|b>)."""
+    """Compute sqrt(<a|a>)."""
 
-    return np.sqrt(product(a, a))
+    return np.linalg.norm(a)
@@ -1,6 +1,7 @@
 # Provide templates and implementations for FidelityComputer class,
 # which wraps a ParametricSystem and computes F and dF for given controls
 import logging
+from collections import OrderedDict
 from floq.core.fidelities import d_operator_distance, operator_distance
 from floq.core.fidelities import transfer_distance, d_transfer_distance
 import numpy as np
@@ -20,7 +21,10 @@ class FidelityBase(object):
     Sub-classes can optionally implement:
         penalty(controls_and_t)
         d_penalty(controls_and_t),
-        _iterate(controls_and_t), which gets called on each iteration.
+        _iterate(controls_and_t), which gets called on each iteration,
+        _cache_params(), see below.
+    (The penalty terms are only evaluated if they are overridden,
+    otherwise adding 0.0 would cost a pass over the whole gradient.)
 
     The __init__ should take the form __init__(self, system, **kwargs)
     for compatibility with EnsembleFidelity.
@@ -29,24 +33,54 @@ class FidelityBase(object):
         f(controls_and_t): returns a real number, the fidelity,
         df(controls_and_t): returns its gradient,
         iterate(controls_and_t): expected to be called after each iteration by
-                                 an Optimizer.
+                                 an Optimizer,
+        clear_cache(): forgets memoised values of f and df (needed if the system
+                       itself is modified).
+
+    If a sub-class implements _cache_params, returning a hashable value that
+    captures all of its parameters that determine the fidelity,
+    f and df are memoised for the last cache_size controls, since optimizers
+    tend to query the same point repeatedly (for instance during line searches).
+    Otherwise nothing is memoised.
 
     Attributes:
         system: the system (or ensemble) under consideration.
         iterations: count of iterations
     """
 
+    cache_size = 4
+
     def __init__(self, system):
         self.system = system
         self.iterations = 0
 
+        self._f_cache = OrderedDict()
+        self._df_cache = OrderedDict()
+
 
     def f(self, controls_and_t):
-        return self._f(controls_and_t) + self.penalty(controls_and_t)
+        key = self._cache_key(controls_and_t)
+        if key in self._f_cache:
+            return self._f_cache[key]
+
+        f = self._f(controls_and_t)
+        if overrides(self.penalty, FidelityBase.penalty):
+            f = f + self.penalty(controls_and_t)
+        self._remember(self._f_cache, key, f)
+        return f
 
 
     def df(self, controls_and_t):
-        return self._df(controls_and_t) + self.d_penalty(controls_and_t)
+        key = self._cache_key(controls_and_t)
+        if key in self._df_cache:
+            return np.copy(self._df_cache[key])
+
+        df = self._df(controls_and_t)
+        if overrides(self.d_penalty, FidelityBase.d_penalty):
+            df = df + self.d_penalty(controls_and_t)
+        if key is not None:
+            self._remember(self._df_cache, key, np.copy(df))
+        return df
 
 
     def iterate(self, controls_and_t):
@@ -54,17 +88,61 @@ class FidelityBase(object):
         Gets called by the Optimizer after each iteration. Increases
         the iteration count self.iterations, and calls the (optional)
         _iterate method.
+
+        The fidelity is only evaluated for logging if INFO messages
+        are actually emitted.
         """
         self.iterations += 1
         self._iterate(controls_and_t)
-        f = self.f(controls_and_t)
-        logging.info('Currently at iteration %i and f=%f' % (self.iterations, f))
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            f = self.f(controls_and_t)
+            logging.info('Currently at iteration %i and f=%f' % (self.iterations, f))
 
 
     def reset_iterations(self):
         self.iterations = 0
 
 
+    def clear_cache(self):
+        self._f_cache.clear()
+        self._df_cache.clear()
+
+
+    def __getstate__(self):
+        # When pickled (e.g. to be sent to a worker process),
+        # only keep the most recent f and df
+        state = self.__dict__.copy()
+        state['_f_cache'] = OrderedDict(list(self._f_cache.items())[-1:])
+        state['_df_cache'] = OrderedDict(list(self._df_cache.items())[-1:])
+        return state
+
+
+    def _cache_params(self):
+        # Parameters of the fidelity that enter the memoisation key,
+        # None means they are unknown and nothing is memoised
+        return None
+
+
+    def _cache_key(self, controls_and_t):
+        # Key under which f and df are memoised for the given controls,
+        # or None if they should not be memoised
+        params = self._cache_params()
+        if params is None or not isinstance(controls_and_t, np.ndarray):
+            return None
+
+        return (params, controls_and_t.tobytes())
+
+
+    def _remember(self, cache, key, value):
+        # Store value, dropping the oldest entry if the cache is full
+        if key is None:
+            return
+
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+
     def _f(self, controls_and_t):
         raise NotImplementedError
 
@@ -86,6 +164,16 @@ class FidelityBase(object):
 
 
 
+def overrides(method, base_method):
+    """
+    Return True if the bound method is not base_method, i.e. if it has been
+    overridden by a sub-class or replaced on the instance.
+    """
+    base_function = getattr(base_method, '__func__', base_method)
+    return getattr(method, '__func__', None) is not base_function
+
+
+
 class EnsembleFidelity(FidelityBase):
     """
     With a given Ensemble, and a FidelityComputer,
@@ -96,14 +184,36 @@ class EnsembleFidelity(FidelityBase):
         super(EnsembleFidelity, self).__init__(ensemble)
         self.fidelities = [fidelity(sys, **params) for sys in ensemble.systems]
 
+        # f and df of the members get written into these buffers
+        # (_df_buffer is allocated once the size of df is known)
+        self._f_buffer = np.empty(len(self.fidelities))
+        self._df_buffer = None
+
+    def _cache_params(self):
+        params = tuple(fid._cache_params() for fid in self.fidelities)
+        if None in params:
+            return None
+        return params
+
+
     def _f(self, controls_and_t):
-        f = np.mean([fid.f(controls_and_t) for fid in self.fidelities])
-        return f
+        for i, fid in enumerate(self.fidelities):
+            self._f_buffer[i] = fid.f(controls_and_t)
+
+        return self._f_buffer.mean()
 
 
     def _df(self, controls_and_t):
-        df = np.mean([fid.df(controls_and_t) for fid in self.fidelities], axis=0)
-        return df
+        df = self.fidelities[0].df(controls_and_t)
+        shape = (len(self.fidelities),) + np.shape(df)
+        if self._df_buffer is None or self._df_buffer.shape != shape:
+            self._df_buffer = np.empty(shape, dtype=np.result_type(df))
+
+        self._df_buffer[0] = df
+        for i in xrange(1, len(self.fidelities)):
+            self._df_buffer[i] = self.fidelities[i].df(controls_and_t)
+
+        return self._df_buffer.mean(axis=0)
 
 
 
@@ -120,6 +230,10 @@ class OperatorDistance(FidelityBase):
         self.target = target
 
 
+    def _cache_params(self):
+        return (self.t, np.asarray(self.target).tobytes())
+
+
     def _f(self, controls):
         u = self.system.u(controls, self.t)
         return operator_distance(u, self.target)
@@ -147,6 +261,10 @@ class TransferDistance(FidelityBase):
         self.final = final
 
 
+    def _cache_params(self):
+        return (self.t, np.asarray(self.initial).tobytes(), np.asarray(self.final).tobytes())
+
+
     def _f(self, controls):
         u = self.system.u(controls, self.t)
         return transfer_distance(u, self.initial, self.final)
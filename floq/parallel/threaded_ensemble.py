@@ -0,0 +1,46 @@
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from floq.optimization.fidelity import EnsembleFidelity
+
+
+class ThreadedEnsembleFidelity(EnsembleFidelity):
+    """
+    With a given Ensemble, and a FidelityComputer,
+    calculate the average fidelity over the whole ensemble
+    by evaluating the members in a pool of nthreads threads.
+
+    Unlike the process based variants, the fidelities stay in this process,
+    so nothing has to be pickled and the members keep their caches.
+    This only pays off as far as the members spend their time in
+    numpy/scipy routines that release the GIL (such as the LAPACK calls).
+    The numba kernels of the evolution (e.g. numba_assemble_k, assemble_du
+    or numba_gram_schmidt) are not compiled with nogil=True, so they hold the GIL
+    and run one at a time -- a sizeable part of the work stays serial.
+    To avoid oversubscribing the cores, the number of BLAS threads
+    should be limited (e.g. OMP_NUM_THREADS=1).
+
+    Note: After use, the thread pool should be shut down by calling close().
+    """
+
+    def __init__(self, nthreads, ensemble, fidelity, **params):
+        super(ThreadedEnsembleFidelity, self).__init__(ensemble, fidelity, **params)
+        self.nthreads = min(nthreads, len(self.fidelities))
+        self.pool = ThreadPool(self.nthreads)
+
+
+    def _f(self, controls_and_t):
+        # The members are independent and only read the controls,
+        # so they can be evaluated concurrently without locking
+        fs = self.pool.map(lambda fid: fid.f(controls_and_t), self.fidelities)
+        return np.mean(fs)
+
+
+    def _df(self, controls_and_t):
+        dfs = self.pool.map(lambda fid: fid.df(controls_and_t), self.fidelities)
+        return np.mean(dfs, axis=0)
+
+
+    def close(self):
+        """ Shut down the thread pool """
+        self.pool.close()
+        self.pool.join()
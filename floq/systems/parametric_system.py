@@ -1,5 +1,5 @@
 import numpy as np
-import copy
+from collections import OrderedDict
 import floq.core.fixed_system as fs
 import floq.errors as er
 
@@ -21,6 +21,8 @@ class ParametricSystemBase(object):
         u(controls, t)
         du(controls, t),
     which implement basic caching and automatically keeps self.nz updated.
+    The computations for the last cache_size pairs of controls and t are kept,
+    but only the current one is pickled.
 
     Attributes:
         nz: (initial) number of Brillouin zones (should be overwritten by subclass)
@@ -28,16 +30,22 @@ class ParametricSystemBase(object):
         sparse: if True, sparse matrix algebra is used (can be overwritten by subclass)
         max_nz: max nz allowed (can be overwritten by subclass)
         decimals: decimals used to check for unitarity (can be overwritten by subclass)
+        cache_size: number of cached computations (can be overwritten by subclass)
+        cache_atol: if not None, controls are rounded to multiples of cache_atol when
+                    looking them up in the cache, and controls that round to the
+                    same multiples share one computation (can be overwritten by subclass)
     """
 
     def __init__(self, **kwargs):
-        self._last_controls = None
-        self._last_t = None
+        self._cache = OrderedDict()
+        self._fixed_system = None
 
         # set defaults
         self.max_nz = 999
         self.sparse = True
         self.decimals = 10
+        self.cache_size = 4
+        self.cache_atol = None
 
         # these should be overwritten by a subclass
         self.nz = 3
@@ -85,18 +93,20 @@ class ParametricSystemBase(object):
 
 
     def _is_cached(self, controls, t):
+        # If a computation for controls and t is cached,
+        # make it the current self._fixed_system and return True
         if not isinstance(controls, np.ndarray):
             return False
-        elif self._last_t != t:
-            return False
+
+        key = self._controls_key(controls, t)
+        if key in self._cache:
+            self._fixed_system = self._cache[key]
+            return True
         else:
-            return np.array_equal(self._last_controls, controls)
+            return False
 
 
     def _set_cached(self, controls, t):
-        self._last_controls = np.copy(controls)
-        self._last_t = copy.copy(t)
-
         hf = self._hf(controls)
         dhf = self._dhf(controls)
         self._fixed_system = fs.FixedSystem(hf, dhf, self.nz, self.omega, t,
@@ -104,6 +114,31 @@ class ParametricSystemBase(object):
                                             sparse=self.sparse,
                                             max_nz=self.max_nz)
 
+        if isinstance(controls, np.ndarray):
+            self._cache[self._controls_key(controls, t)] = self._fixed_system
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)  # drop the oldest entry
+
+
+    def __getstate__(self):
+        # When pickled (e.g. to be sent to a worker process),
+        # only keep the current computation, not the whole cache
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict((key, fixed) for key, fixed in self._cache.items()
+                                      if fixed is self._fixed_system)
+        return state
+
+
+    def _controls_key(self, controls, t):
+        # The raw bytes make a cheap key (identity is not enough,
+        # since optimizers modify arrays in place)
+        if self.cache_atol is None:
+            return (t, controls.tobytes())
+        else:
+            # (kept as floats, an integer type could overflow)
+            quantized = np.round(controls/self.cache_atol)
+            return (t, quantized.tobytes())
+
     def heff(self, controls, t):
         u = self.u(controls, t)
         udot = self.udot(controls, t)
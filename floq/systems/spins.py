@@ -1,4 +1,6 @@
 import numpy as np
+from numba import autojit
+from floq.helpers.numpy_replacements import numba_zeros
 from floq.systems.ensemble import EnsembleBase
 from floq.systems.parametric_system import ParametricSystemBase
 
@@ -37,7 +39,11 @@ class SpinEnsemble(EnsembleBase):
         self.nc = 2*ncomp+1
         self.nz = 3*np.ones(self.n, dtype=int)
 
-        self._systems = [SpinSystem(ncomp, amps[i], freqs[i], omega) for i in xrange(n)]
+        # dhf depends neither on the controls nor on the spin,
+        # so a single copy is shared by all systems of the ensemble
+        shared_dhf = dhf(ncomp)
+        self._systems = [SpinSystem(ncomp, amps[i], freqs[i], omega, shared_dhf=shared_dhf)
+                         for i in xrange(n)]
 
     @property
     def systems(self):
@@ -89,9 +95,12 @@ class SpinSystem(ParametricSystemBase):
     and np+1 non-zero Fourier components in Hf.
     """
 
-    def __init__(self, ncomp, amp, freq, omega):
+    def __init__(self, ncomp, amp, freq, omega, shared_dhf=None):
         """
         Initialise a SpinSystem.
+
+        shared_dhf can be used to pass an already assembled dhf(ncomp),
+        for instance one shared between the members of an ensemble.
         """
         super(SpinSystem, self).__init__()
 
@@ -101,7 +110,10 @@ class SpinSystem(ParametricSystemBase):
         self.omega = omega
 
         self.nz = 3
-        self.dhf = dhf(ncomp)  # independent of controls!
+        if shared_dhf is None:
+            self.dhf = dhf(ncomp)  # independent of controls!
+        else:
+            self.dhf = shared_dhf
 
 
     def _hf(self, controls):
@@ -122,12 +134,15 @@ def hf(ncomp, freq, controls):
     # assemble hf for one spin, given a detuning
     # freq, the control amplitudes controls, and
     # ncomp components of the control pulse
+    return numba_hf(ncomp, freq, controls)
 
+@autojit(nopython=True)
+def numba_hf(ncomp, freq, controls):
     nc = 2*ncomp+1  # number of components in hf
 
-    hf = np.zeros([nc, 2, 2], dtype='complex128')
+    hf = numba_zeros((nc, 2, 2))
 
-    for k in xrange(0, ncomp):
+    for k in range(0, ncomp):
         # the controls are ordered in reverse
         # compared to how they are placed in hf
         a = controls[-2*k-2]
@@ -136,15 +151,15 @@ def hf(ncomp, freq, controls):
         # The controls are placed symmetrically around
         # the centre of hf, so we can place them at the
         # same time to save us some work!
-        hf[k, :, :] = np.array([[0.0, 0.25*(1j*a+b)],
-                                [0.25*(1j*a-b), 0.0]])
+        hf[k, 0, 1] = 0.25*(1j*a+b)
+        hf[k, 1, 0] = 0.25*(1j*a-b)
 
-        hf[-k-1, :, :] = np.array([[0.0, -0.25*(1j*a+b)],
-                                   [0.25*(-1j*a+b), 0.0]])
+        hf[-k-1, 0, 1] = -0.25*(1j*a+b)
+        hf[-k-1, 1, 0] = 0.25*(-1j*a+b)
 
     # Set centre (with Fourier index 0)
-    hf[ncomp] = np.array([[freq/2.0, 0.0],
-                          [0.0, -freq/2.0]])
+    hf[ncomp, 0, 0] = freq/2.0
+    hf[ncomp, 1, 1] = -freq/2.0
 
     return hf
 
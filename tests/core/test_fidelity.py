@@ -27,6 +27,20 @@ class TestTransferFidelity(CustomAssertions):
         self.assertAlmostEqualWithDecimals(fid, 0.131584, 4)
 
 
+class TestTransferFidelityDeriv(CustomAssertions):
+
+    def test_d_transfer_fidelity(self):
+        dus = np.array([u3, u4])
+        # fid' = <f|u'|i><i|u^dagger|f> + <i|u'^dagger|f><f|u|i>
+        iuf = f.expectation_value(v2, np.conj(u1.T), v1)
+        fui = f.expectation_value(v1, u1, v2)
+        target = np.real(np.array([f.expectation_value(v1, du, v2)*iuf +
+                                   f.expectation_value(v2, np.conj(du.T), v1)*fui for du in dus]))
+        actual = f.d_transfer_fidelity(u1, dus, v2, v1)
+        self.assertArrayEqual(actual, target, 8)
+
+
+
 class TestTransferDistance(CustomAssertions):
 
     def test_is_zero_if_identity(self):
@@ -2,6 +2,7 @@ from unittest import TestCase
 from tests.assertions import CustomAssertions
 import numpy as np
 from floq.helpers.matrix import is_unitary, adjoint, gram_schmidt, norm, product
+from floq.helpers.matrix import block_gram_schmidt, numba_gram_schmidt
 
 
 
@@ -55,3 +56,28 @@ class TestGramSchmidt(CustomAssertions):
 
     def test_normalised_z(self):
         self.assertAlmostEqual(norm(self.z), 1.0)
+
+    def test_integer_vectors_not_truncated(self):
+        res = gram_schmidt(np.array([[1, 1], [1, 0]]))
+        self.assertAlmostEqual(norm(res[0]), 1.0)
+        self.assertAlmostEqual(norm(res[1]), 1.0)
+
+
+class TestGramSchmidtBranches(CustomAssertions):
+
+    def setUp(self):
+        np.random.seed(1)
+        self.array = np.random.rand(70, 80) + 1j*np.random.rand(70, 80)
+
+    def test_orthonormal_many_vectors(self):
+        res = gram_schmidt(self.array)
+        self.assertArrayEqual(np.dot(np.conj(res), res.T), np.eye(70), 10)
+
+    def test_branches_agree(self):
+        vecs = self.array[:10]
+        compiled = np.empty_like(vecs)
+        block = np.empty_like(vecs)
+
+        self.assertTrue(numba_gram_schmidt(vecs, compiled))
+        self.assertTrue(block_gram_schmidt(vecs, block))
+        self.assertArrayEqual(compiled, block, 10)
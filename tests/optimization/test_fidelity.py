@@ -1,9 +1,10 @@
+import logging
 from unittest import TestCase
 from tests.assertions import CustomAssertions
 import floq.optimization.fidelity as fid
 from floq.systems.spins import SpinEnsemble
 import numpy as np
-from mock import MagicMock
+from mock import MagicMock, sentinel
 
 
 class TestFidelityBaseIterations(TestCase):
@@ -23,6 +24,137 @@ class TestFidelityBaseIterations(TestCase):
         self.computer.reset_iterations()
         self.assertEqual(self.computer.iterations, 0)
 
+    def test_iterate_skips_f_if_not_logging(self):
+        logger = logging.getLogger()
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            self.computer.iterate(None)
+        finally:
+            logger.setLevel(level)
+        self.computer._f.assert_not_called()
+
+
+
+class CachedFidelity(fid.FidelityBase):
+    def _cache_params(self):
+        return ()
+
+
+class TestFidelityBaseCaching(TestCase):
+    def setUp(self):
+        self.computer = CachedFidelity(None)
+        self.computer._f = MagicMock(return_value=0.5)
+        self.computer._df = MagicMock(return_value=np.array([0.1, 0.2]))
+
+        self.ctrls1 = np.array([1.2, 1.1])
+        self.ctrls2 = np.array([1.3, 1.1])
+
+    def test_f_caches_if_same(self):
+        self.computer.f(self.ctrls1)
+        self.computer.f(np.copy(self.ctrls1))
+        self.computer._f.assert_called_once()
+
+    def test_f_does_not_cache_if_not_same(self):
+        self.computer.f(self.ctrls1)
+        self.computer.f(self.ctrls2)
+        self.assertEqual(self.computer._f.call_count, 2)
+
+    def test_df_caches_if_same(self):
+        self.computer.df(self.ctrls1)
+        self.computer.df(self.ctrls1)
+        self.computer._df.assert_called_once()
+
+    def test_cached_df_cannot_be_modified(self):
+        df = self.computer.df(self.ctrls1)
+        df[0] = 12.0
+        self.assertEqual(self.computer.df(self.ctrls1)[0], 0.1)
+
+    def test_cache_size_is_bounded(self):
+        for i in xrange(self.computer.cache_size+1):
+            self.computer.f(np.array([float(i)]))
+        self.computer.f(np.array([0.0]))
+        self.assertEqual(self.computer._f.call_count, self.computer.cache_size+2)
+
+    def test_clear_cache(self):
+        self.computer.f(self.ctrls1)
+        self.computer.clear_cache()
+        self.computer.f(self.ctrls1)
+        self.assertEqual(self.computer._f.call_count, 2)
+
+    def test_only_latest_memo_pickled(self):
+        self.computer.f(self.ctrls1)
+        self.computer.f(self.ctrls2)
+        self.computer.df(self.ctrls2)
+
+        state = self.computer.__getstate__()
+        self.assertEqual(list(state['_f_cache'].values()), [0.5])
+        self.assertEqual(len(state['_df_cache']), 1)
+        self.assertEqual(len(self.computer._f_cache), 2)
+
+    def test_no_caching_without_cache_params(self):
+        computer = fid.FidelityBase(None)
+        computer._f = MagicMock(return_value=0.5)
+        computer.f(self.ctrls1)
+        computer.f(self.ctrls1)
+        self.assertEqual(computer._f.call_count, 2)
+
+    def test_df_not_copied_without_cache_params(self):
+        computer = fid.FidelityBase(None)
+        df = np.array([0.1, 0.2])
+        computer._df = MagicMock(return_value=df)
+        self.assertIs(computer.df(self.ctrls1), df)
+
+    def test_operator_distance_does_not_cache_if_t_changed(self):
+        system = MagicMock()
+        system.u = MagicMock(return_value=np.eye(2))
+        computer = fid.OperatorDistance(system, 1.0, np.eye(2))
+        computer.f(self.ctrls1)
+        computer.f(self.ctrls1)
+        computer.t = 2.0
+        computer.f(self.ctrls1)
+        self.assertEqual(system.u.call_count, 2)
+
+    def test_operator_distance_does_not_cache_if_target_changed(self):
+        system = MagicMock()
+        system.u = MagicMock(return_value=np.eye(2))
+        computer = fid.OperatorDistance(system, 1.0, np.eye(2))
+        computer.f(self.ctrls1)
+        computer.target = -np.eye(2)
+        self.assertEqual(computer.f(self.ctrls1), 2.0)
+
+
+
+class FidelityWithPenalty(fid.FidelityBase):
+    def penalty(self, controls_and_t):
+        return 1.0
+
+    def d_penalty(self, controls_and_t):
+        return np.array([1.0, 1.0])
+
+
+class TestFidelityBasePenalty(CustomAssertions):
+    def test_no_penalty_added_by_default(self):
+        # Adding the default penalty would fail for these sentinels
+        computer = fid.FidelityBase(None)
+        computer._f = MagicMock(return_value=sentinel.f)
+        computer._df = MagicMock(return_value=sentinel.df)
+        self.assertIs(computer.f(np.array([1.2, 1.1])), sentinel.f)
+        self.assertIs(computer.df(np.array([1.2, 1.1])), sentinel.df)
+
+    def test_penalty_added_if_set_on_instance(self):
+        computer = fid.FidelityBase(None)
+        computer._f = MagicMock(return_value=0.5)
+        computer.penalty = lambda controls_and_t: 1.0
+        self.assertEqual(computer.f(np.array([1.2, 1.1])), 1.5)
+
+    def test_penalty_added_if_implemented(self):
+        computer = FidelityWithPenalty(None)
+        computer._f = MagicMock(return_value=0.5)
+        computer._df = MagicMock(return_value=np.array([0.1, 0.2]))
+        self.assertEqual(computer.f(np.array([1.2, 1.1])), 1.5)
+        self.assertArrayEqual(computer.df(np.array([1.2, 1.1])), np.array([1.1, 1.2]))
+
 
 
 class TestEnsembleFidelity(CustomAssertions):
@@ -37,3 +169,11 @@ class TestEnsembleFidelity(CustomAssertions):
         f = fid.EnsembleFidelity(self.ensemble, fid.OperatorDistance, t=1.0, target=target)
         print f.f(np.array([1.5, 1.5, 1.5, 1.5]))
         self.assertTrue(np.isclose(f.f(np.array([1.5, 1.5, 1.5, 1.5])), 0.0, atol=1e-5))
+
+
+
+    def test_df_is_mean(self):
+        f = fid.EnsembleFidelity(self.ensemble, fid.OperatorDistance, t=1.0, target=np.eye(2))
+        f.fidelities[0].df = MagicMock(return_value=np.array([1.0, 2.0]))
+        f.fidelities[1].df = MagicMock(return_value=np.array([3.0, 0.0]))
+        self.assertArrayEqual(f.df(np.array([1.5, 1.5])), np.array([2.0, 1.0]))
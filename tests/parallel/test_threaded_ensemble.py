@@ -0,0 +1,30 @@
+from tests.assertions import CustomAssertions
+import floq.optimization.fidelity as fid
+from floq.parallel.threaded_ensemble import ThreadedEnsembleFidelity
+from floq.systems.spins import SpinEnsemble
+import numpy as np
+
+
+class TestThreadedEnsembleFidelity(CustomAssertions):
+    def setUp(self):
+        # separate (identical) ensembles, so the systems do not share their caches
+        freqs, amps = np.array([1.1, 1.2]), np.array([1, 0.9])
+        serial_ensemble = SpinEnsemble(2, 2, 1.5, freqs, amps)
+        threaded_ensemble = SpinEnsemble(2, 2, 1.5, freqs, amps)
+        self.target = np.array([[0.105818 - 0.324164j, -0.601164 - 0.722718j],
+                                [0.601164 - 0.722718j, 0.105818 + 0.324164j]])
+        self.ctrl = np.array([1.5, 1.3, 1.4, 1.1])
+
+        self.serial = fid.EnsembleFidelity(serial_ensemble, fid.OperatorDistance,
+                                           t=1.0, target=self.target)
+        self.threaded = ThreadedEnsembleFidelity(2, threaded_ensemble, fid.OperatorDistance,
+                                                 t=1.0, target=self.target)
+
+    def tearDown(self):
+        self.threaded.close()
+
+    def test_f_same_as_serial(self):
+        self.assertAlmostEqualWithDecimals(self.threaded.f(self.ctrl), self.serial.f(self.ctrl), 10)
+
+    def test_df_same_as_serial(self):
+        self.assertArrayEqual(self.threaded.df(self.ctrl), self.serial.df(self.ctrl), 10)
@@ -30,8 +30,7 @@ class TestParametricSystemBaseCaching(TestCase):
         self.real._dhf = MagicMock()
         self.real._fixed_system = MagicMock()
 
-        self.real._last_controls = None
-        self.real._last_t = None
+        self.real._cache.clear()
 
         self.real.nz = MagicMock()
         self.real.omega = MagicMock()
@@ -53,3 +52,69 @@ class TestParametricSystemBaseCaching(TestCase):
             self.real.u(self.ctrls1, 1.0)
             self.real.u(self.ctrls2, 1.0)
             self.assertEqual(mock.call_count, 2)
+
+    def test_u_does_not_cache_if_modified_in_place(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(self.ctrls1, 1.0)
+            self.ctrls1[0] = 1.4
+            self.real.u(self.ctrls1, 1.0)
+            self.assertEqual(mock.call_count, 2)
+
+    def test_u_does_not_cache_if_t_differs(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(self.ctrls1, 1.0)
+            self.real.u(self.ctrls1, 2.0)
+            self.assertEqual(mock.call_count, 2)
+
+    def test_u_caches_several(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(self.ctrls1, 1.0)
+            self.real.u(self.ctrls2, 1.0)
+            self.real.u(self.ctrls1, 1.0)
+            self.assertEqual(mock.call_count, 2)
+
+    def test_cache_is_bounded(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            for i in xrange(self.real.cache_size+1):
+                self.real.u(self.ctrls1, float(i))
+            self.real.u(self.ctrls1, 0.0)
+            self.assertEqual(mock.call_count, self.real.cache_size+2)
+
+    def test_u_caches_if_close_with_atol(self):
+        self.real.cache_atol = 1e-8
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(self.ctrls1, 1.0)
+            self.real.u(self.ctrls1+1e-12, 1.0)
+            mock.assert_called_once()
+
+    def test_u_does_not_cache_if_close_without_atol(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(self.ctrls1, 1.0)
+            self.real.u(self.ctrls1+1e-12, 1.0)
+            self.assertEqual(mock.call_count, 2)
+
+    def test_u_does_not_cache_large_controls_with_atol(self):
+        self.real.cache_atol = 1e-12
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(np.array([1e7, 0.0]), 1.0)
+            self.real.u(np.array([3e7, 0.0]), 1.0)
+            self.assertEqual(mock.call_count, 2)
+
+    def test_only_current_computation_pickled(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            mock.side_effect = lambda *args, **kwargs: MagicMock()
+            self.real.u(self.ctrls1, 1.0)
+            self.real.u(self.ctrls2, 1.0)
+
+            state = self.real.__getstate__()
+            self.assertEqual(list(state['_cache'].values()), [self.real._fixed_system])
+            self.assertEqual(len(self.real._cache), 2)
+
+    def test_current_computation_cached_after_unpickling(self):
+        with patch('floq.core.fixed_system.FixedSystem') as mock:
+            self.real.u(self.ctrls1, 1.0)
+
+            restored = ps.ParametricSystemBase()
+            restored.__dict__.update(self.real.__getstate__())
+            restored.u(self.ctrls1, 1.0)
+            mock.assert_called_once()
@@ -95,6 +95,12 @@ class TestSpinEnsemble(CustomAssertions):
         self.assertIsInstance(self.ensemble.systems, list)
 
 
+    def test_systems_share_dhf(self):
+        first = self.ensemble.systems[0]
+        for system in self.ensemble.systems:
+            self.assertIs(system.dhf, first.dhf)
+
+
     def test_single_system_evolves_correctly(self):
         system = self.ensemble.systems[0]
         result = system.u(self.controls, self.t)